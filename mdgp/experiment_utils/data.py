@@ -3,7 +3,7 @@ from torch import Tensor
 
 import torch 
 import math 
-from mdgp.utils import spherical_antiharmonic, spherical_harmonic, sphere_uniform_grid, rotate
+from mdgp.utils import spherical_antiharmonic, spherical_harmonic, sphere_uniform_grid, rotate, specialize_non_default
 from dataclasses import dataclass, field
 
 
@@ -16,6 +16,7 @@ __all__ = [
 ]
 
 
+@specialize_non_default
 @dataclass
 class DataArguments: 
     target_name: str = field(default='smooth', metadata={'help': 'Name of the target function. Must be one of ["smooth", "singular"]'})
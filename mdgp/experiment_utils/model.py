@@ -4,12 +4,15 @@ from geometric_kernels.spaces import Space
 
 # Imports 
 from dataclasses import dataclass, field
-from mdgp.utils import sphere_uniform_grid
+from functools import lru_cache
+import torch 
+from mdgp.utils import sphere_uniform_grid, specialize_non_default
 from mdgp.models.deep_gps import GeometricManifoldDeepGP, EuclideanManifoldDeepGP, EuclideanDeepGP
 from geometric_kernels.spaces import Hypersphere
 from gpytorch.priors import GammaPrior
 
 
+@specialize_non_default
 @dataclass
 class ModelArguments:
     space_name: str = field(default='hypersphere', metadata={'help': 'The space where the data lives'})
@@ -26,6 +29,8 @@ class ModelArguments:
     parametrised_frame: bool = field(default=False, metadata={'help': 'Whether to use a parametrised frame'})
     rotated_frame: bool = field(default=False, metadata={'help': 'Whether to use a rotated frame'})
     outputscale_mean: float = field(default=1.0, metadata={'help': 'Mean of the outputscale'})
+    share_covariance: bool = field(default=False, metadata={'help': 'Whether the hidden layers share a single kernel across their outputs'})
+    fused_variational_strategy: bool = field(default=False, metadata={'help': 'Whether the whitened layers use FusedVariationalStrategy instead of VariationalStrategy'})
 
     @property 
     def space(self):
@@ -34,6 +39,20 @@ class ModelArguments:
         raise ValueError(f"Unknown space: {self.space_name}. Must be one of ['hypersphere'].")
 
 
+@lru_cache(maxsize=16)
+def _cached_sphere_uniform_grid(n: int, dtype: torch.dtype) -> Tensor: 
+    return sphere_uniform_grid(n=n).to(dtype)
+
+
+def cached_sphere_uniform_grid(n: int) -> Tensor: 
+    """
+    Same as `sphere_uniform_grid`, but memoized on the number of points and the default dtype, since sweeps 
+    build many models with the same number of inducing points. Returns a clone, so that the cached grid is 
+    never modified by the caller. 
+    """
+    return _cached_sphere_uniform_grid(n, torch.get_default_dtype()).clone()
+
+
 def get_inducing_points(num_inducing: int, space: Space) -> Tensor:
     if isinstance(space, Hypersphere) and space.dim == 2:  
         return sphere_uniform_grid(num_inducing)
@@ -46,7 +65,7 @@ def get_outputscale_prior(outputscale_mean: float = 1.0):
 
 def create_model(model_args: ModelArguments):
     space = Hypersphere(dim=2)
-    inducing_points = sphere_uniform_grid(n=model_args.num_inducing)
+    inducing_points = cached_sphere_uniform_grid(n=model_args.num_inducing)
     model_name = model_args.model_name
     outputscale_prior = get_outputscale_prior(outputscale_mean=model_args.outputscale_mean)
     if model_name == 'geometric_manifold':
@@ -61,6 +80,8 @@ def create_model(model_args: ModelArguments):
             nu=model_args.nu,
             project_to_tangent=model_args.project_to_tangent, 
             tangent_to_manifold=model_args.tangent_to_manifold,
+            share_covariance=model_args.share_covariance,
+            fused_variational_strategy=model_args.fused_variational_strategy,
         )
     if model_name == 'euclidean_manifold': 
         return EuclideanManifoldDeepGP(
@@ -72,6 +93,8 @@ def create_model(model_args: ModelArguments):
             nu=model_args.nu,
             project_to_tangent=model_args.project_to_tangent, 
             tangent_to_manifold=model_args.tangent_to_manifold,
+            share_covariance=model_args.share_covariance,
+            fused_variational_strategy=model_args.fused_variational_strategy,
         )
     if model_name == 'euclidean': 
         return EuclideanDeepGP(
@@ -80,5 +103,7 @@ def create_model(model_args: ModelArguments):
             num_hidden=model_args.num_hidden, 
             nu=model_args.nu, 
             learn_inducing_locations=model_args.learn_inducing_locations, 
+            share_covariance=model_args.share_covariance,
+            fused_variational_strategy=model_args.fused_variational_strategy,
         )
     raise ValueError(f"Unknown model name: {model_name}. Must be one of ['geometric_manifold', 'euclidean_manifold', 'euclidean']")
@@ -9,12 +9,14 @@ Reproducibility:
       that the experiments can be run on different machines in parallel. 
 """
 import os 
+import re 
 import json 
-from dataclasses import dataclass, field, fields, asdict
+from dataclasses import dataclass, field, asdict
 from itertools import product 
 from lightning.pytorch import seed_everything
 from mdgp.experiment_utils import ModelArguments, DataArguments, TrainingArguments
 from enum import Enum
+from typing import Optional
 
 
 __all__ = [
@@ -24,9 +26,13 @@ __all__ = [
     'create_experiment_config',
     'create_experiment_config_from_json',
     'set_experiment_seed',
+    'read_experiment_manifest',
 ]
 
 
+MANIFEST_FILE_NAME = 'experiments_manifest.json'
+
+
 # TODO Move to utils
 def non_default_fields(dc) -> dict:
     """
@@ -39,12 +45,8 @@ def non_default_fields(dc) -> dict:
     Returns:
     - Dict[str, Any]: Dictionary with fields and values different from defaults.
     """
-    result = {}
-    for field in fields(dc):
-        current_value = getattr(dc, field.name)        
-        if current_value != field.default:
-            result[field.name] = current_value
-    return result
+    # The argument dataclasses are decorated with `specialize_non_default`, which generates this method 
+    return dc._non_default()
 
 
 # TODO Move to ExperimentConfig
@@ -85,6 +87,9 @@ class ExperimentStatus(Enum):
     COMPLETED = 'completed'
 
 
+_STATUS_PATTERN = re.compile(r'"status"\s*:\s*"\w+"')
+
+
 @dataclass 
 class ExperimentConfig:
     """
@@ -97,6 +102,14 @@ class ExperimentConfig:
     status: ExperimentStatus = field(default=ExperimentStatus.READY, metadata={'help': 'The status of the experiment.'})
     file_name: str = field(default='config.json', metadata={'help': 'The name of the config file.'})
 
+    def __post_init__(self):
+        # Reject argument combinations that are bound to fail once training starts, so that sweeps never write them 
+        if self.model_arguments.share_covariance: 
+            if not self.model_arguments.fused_variational_strategy: 
+                raise ValueError("share_covariance requires fused_variational_strategy.")
+            if self.training_arguments.sample_hidden == 'pathwise': 
+                raise ValueError("share_covariance is not supported with sample_hidden='pathwise'.")
+
     @property
     def seed(self):
         return self.run
@@ -123,6 +136,26 @@ class ExperimentConfig:
         with open(file_path, 'w') as f:
             json.dump(self.to_dict(), f, indent=4)
 
+    def update_status_json(self, dir_path, status: ExperimentStatus):
+        """
+        Sets the status and patches it into an existing config file in dir_path without re-serializing the 
+        rest of the config. The file is replaced atomically, so a crash never leaves a truncated config behind.
+        """
+        self.status = status
+        file_path = os.path.join(dir_path, self.file_name)
+        with open(file_path, 'r') as f:
+            text = f.read()
+        text, num_subs = _STATUS_PATTERN.subn(f'"status": "{status.value}"', text, count=1)
+        
+        # Fall back to a full write if the file has no status field
+        if num_subs == 0: 
+            return self.to_json(dir_path)
+        
+        tmp_file_path = f'{file_path}.tmp'
+        with open(tmp_file_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_file_path, file_path)
+
     @classmethod
     def from_dict(cls, data):
         data['status'] = ExperimentStatus(data['status'])
@@ -146,12 +179,54 @@ def set_experiment_seed(run: int) -> None:
 # TODO Move to utils
 def expand_args(args_dict):
     """
-    Converts a dictionary of arguments into a list of dictionaries where each dictionary is a unique 
+    Converts a dictionary of arguments into a generator of dictionaries where each dictionary is a unique 
     combination of arguments.
     """
     keys = args_dict.keys()
     values = (args_dict[key] if isinstance(args_dict[key], list) else [args_dict[key]] for key in keys)
-    return [dict(zip(keys, combination)) for combination in product(*values)]
+    return (dict(zip(keys, combination)) for combination in product(*values))
+
+
+def existing_config_paths(dir_path, file_name='config.json') -> set:
+    """
+    Scans an experiment tree of the form dir_path/<experiment_name>/<run_name>/<file_name> once and returns the 
+    set of paths, relative to dir_path, of all the config files that already exist.
+    """
+    if not os.path.isdir(dir_path): 
+        return set()
+    
+    paths = set()
+    with os.scandir(dir_path) as experiment_entries:
+        for experiment_entry in experiment_entries:
+            if not experiment_entry.is_dir():
+                continue 
+            with os.scandir(experiment_entry.path) as run_entries:
+                for run_entry in run_entries:
+                    if run_entry.is_dir() and os.path.isfile(os.path.join(run_entry.path, file_name)):
+                        paths.add(os.path.join(experiment_entry.name, run_entry.name, file_name))
+    return paths
+
+
+def read_experiment_manifest(dir_path) -> Optional[list]: 
+    """
+    Returns the paths, relative to dir_path, of the config files listed in the manifest of an experiment tree, 
+    or None if the tree has no manifest.
+    """
+    manifest_path = os.path.join(dir_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path): 
+        return None 
+    with open(manifest_path, 'r') as f:
+        return json.load(f)['config_paths']
+
+
+def write_experiment_manifest(dir_path, config_paths) -> None: 
+    """
+    Writes the manifest of an experiment tree, merging the given config paths with the ones already listed.
+    """
+    config_paths = set(config_paths).union(read_experiment_manifest(dir_path) or [])
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, MANIFEST_FILE_NAME), 'w') as f:
+        json.dump({'config_paths': sorted(config_paths)}, f, indent=4)
 
 
 def create_experiment_config_from_json(json_config, dir_path, overwrite=False) -> None:
@@ -163,37 +238,45 @@ def create_experiment_config_from_json(json_config, dir_path, overwrite=False) -
     - dir_path (str): The path to the parent directory where the experiment folders will be created.
     """
 
-    # Expand arguments to get all possible configurations
-    model_args_list = expand_args(json_config['model_arguments'])
-    data_args_list = expand_args(json_config['data_arguments'])
-    training_args_list = expand_args(json_config['training_arguments'])
     runs = json_config['runs']
-
-    # Get all combinations of arguments
-    for model_args, data_args, training_args in product(model_args_list, data_args_list, training_args_list):
-        for run in runs:
-            config = ExperimentConfig(
-                model_arguments=ModelArguments(**model_args),
-                data_arguments=DataArguments(**data_args),
-                training_arguments=TrainingArguments(**training_args),
-                run=run,
-            )
-
-            # Create experiment directory if it doesn't exist
-            experiment_path = os.path.join(dir_path, config.experiment_name)
-            os.makedirs(experiment_path, exist_ok=True)
-
-            # Create run directory if doesn't exist 
-            run_path = os.path.join(experiment_path, config.run_name)
-            os.makedirs(run_path, exist_ok=True)
-
-            # Maybe skip if config file already exists
-            config_path = os.path.join(run_path, config.file_name)
-            if os.path.exists(config_path) and not overwrite: 
-                continue 
-            
-            # Save config file 
-            config.to_json(run_path)
+    # Configs already in the tree (e.g. from other sweeps, or written before manifests existed) go into the 
+    # manifest too, since runners only look at the manifest once there is one 
+    existing_paths = existing_config_paths(dir_path)
+    manifest_paths = set(existing_paths)
+    if overwrite: 
+        existing_paths = set()
+
+    # Stream through all combinations of arguments. The inner expansions are regenerated for each outer 
+    # combination so that only a single configuration is held in memory at a time.
+    for model_args in expand_args(json_config['model_arguments']):
+        for data_args in expand_args(json_config['data_arguments']):
+            for training_args in expand_args(json_config['training_arguments']):
+                for run in runs:
+                    config = ExperimentConfig(
+                        model_arguments=ModelArguments(**model_args),
+                        data_arguments=DataArguments(**data_args),
+                        training_arguments=TrainingArguments(**training_args),
+                        run=run,
+                    )
+
+                    # Maybe skip if config file already exists
+                    relative_run_path = os.path.join(config.experiment_name, config.run_name)
+                    relative_config_path = os.path.join(relative_run_path, config.file_name)
+                    manifest_paths.add(relative_config_path)
+                    if relative_config_path in existing_paths: 
+                        continue 
+                    if not overwrite: 
+                        existing_paths.add(relative_config_path)
+
+                    # Create experiment and run directories if they don't exist
+                    run_path = os.path.join(dir_path, relative_run_path)
+                    os.makedirs(run_path, exist_ok=True)
+                    
+                    # Save config file 
+                    config.to_json(run_path)
+
+    # List every config file of the tree, so that runners do not have to crawl it 
+    write_experiment_manifest(dir_path, manifest_paths)
 
 
 def create_experiment_config(json_config_path, dir_path, overwrite=False) -> None: 
@@ -233,6 +316,5 @@ class ExperimentConfigReader:
             self._update_status(status)
 
     def _update_status(self, status):
-        # Instead of directly modifying the JSON, we update the ExperimentConfig object and save it
-        self.experiment_config.status = status
-        self.experiment_config.to_json(os.path.dirname(self.file_path))
+        # Only the status changes, so patch it in place rather than re-serializing the whole config
+        self.experiment_config.update_status_json(os.path.dirname(self.file_path), status)
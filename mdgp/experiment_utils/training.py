@@ -1,3 +1,5 @@
+import torch 
+import warnings 
 from torch import no_grad 
 from dataclasses import dataclass, field
 from tqdm.autonotebook import tqdm 
@@ -6,6 +8,7 @@ from gpytorch.metrics import (
     standardized_mean_squared_error, quantile_coverage_error, negative_log_predictive_density
 )
 from mdgp.experiment_utils.logging import log 
+from mdgp.utils import specialize_non_default
 
 
 __all__ = [
@@ -13,9 +16,11 @@ __all__ = [
     'train_step',
     'test_step',
     'fit',
+    'compile_loss_fn',
 ]
 
 
+@specialize_non_default
 @dataclass
 class TrainingArguments: 
     num_steps: int = field(default=1000, metadata={'help': 'Number of steps to train for'})
@@ -23,17 +28,48 @@ class TrainingArguments:
     sample_hidden: str = field(default='naive', metadata={'help': 'Name of the function to sample from the hidden space. Must be one of ["naive", "pathwise"]'})
 
 
-def train_step(model, inputs, targets, criterion, sample_hidden='naive', loggers=None, step=None): 
-    model.train() 
-    outputs = model(inputs, sample_hidden=sample_hidden)
-    loss = criterion(outputs, targets)
+def compile_loss_fn(model, criterion, sample_hidden='naive'): 
+    """
+    Returns a `torch.compile`d function mapping (inputs, targets) to the training loss. Falls back to eager 
+    execution, with a warning, if the compiler fails, since not every gpytorch/linear_operator code path is 
+    supported by it. Only compiler (dynamo/inductor) errors trigger the fallback, other errors are raised as is. 
+    """
+    from torch._dynamo.exc import TorchDynamoException
+
+    def loss_fn(inputs, targets): 
+        return criterion(model(inputs, sample_hidden=sample_hidden), targets)
+    
+    compiled_loss_fn = torch.compile(loss_fn, dynamic=False)
+    
+    def loss_fn_with_fallback(inputs, targets): 
+        nonlocal compiled_loss_fn
+        if compiled_loss_fn is not None: 
+            try: 
+                return compiled_loss_fn(inputs, targets)
+            except TorchDynamoException as e: 
+                warnings.warn(f"Compiling the training step failed, falling back to eager execution: {e}")
+                compiled_loss_fn = None 
+        return loss_fn(inputs, targets)
+    return loss_fn_with_fallback
+
+
+def train_step(model, inputs, targets, criterion, sample_hidden='naive', loggers=None, step=None, loss_fn=None): 
+    # Switching modes walks the whole module tree, so only do it when coming back from validation 
+    if not model.training: 
+        model.train() 
+    if loss_fn is not None: 
+        loss = loss_fn(inputs, targets)
+    else: 
+        outputs = model(inputs, sample_hidden=sample_hidden)
+        loss = criterion(outputs, targets)
     log(loggers=loggers, metrics={'elbo': loss}, step=step)
     return loss 
 
 
 def test_step(model, inputs, targets, sample_hidden='naive', train_targets=None, loggers=None, step=None):
     with no_grad():
-        model.eval() 
+        if model.training: 
+            model.eval() 
         outputs_f = model(inputs, sample_hidden=sample_hidden)
         outputs_y = model.likelihood(outputs_f)
         metrics = {
@@ -49,8 +85,9 @@ def test_step(model, inputs, targets, sample_hidden='naive', train_targets=None,
     return metrics 
 
 
-def fit(model, optimizer, criterion, train_inputs, train_targets, val_inputs=None, val_targets=None, train_loggers=None, val_loggers=None, training_args: TrainingArguments = None): 
+def fit(model, optimizer, criterion, train_inputs, train_targets, val_inputs=None, val_targets=None, train_loggers=None, val_loggers=None, training_args: TrainingArguments = None, compile_step=False): 
     validate = val_inputs is not None and val_targets is not None
+    loss_fn = compile_loss_fn(model=model, criterion=criterion, sample_hidden=training_args.sample_hidden) if compile_step else None
     metrics = {'elbo': None, 'nlpd': None, 'smse': None}
 
     pbar = tqdm(range(1, training_args.num_steps + 1), desc="Fitting")
@@ -58,7 +95,7 @@ def fit(model, optimizer, criterion, train_inputs, train_targets, val_inputs=Non
         # Training step and display training metrics 
         optimizer.zero_grad(set_to_none=True)
         loss = train_step(model=model, inputs=train_inputs, targets=train_targets, criterion=criterion, sample_hidden=training_args.sample_hidden, 
-                          loggers=train_loggers, step=step)
+                          loggers=train_loggers, step=step, loss_fn=loss_fn)
         loss.backward()
         optimizer.step() 
         metrics.update({'elbo': loss.item()})
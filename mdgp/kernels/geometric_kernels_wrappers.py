@@ -12,10 +12,11 @@ class SingleOutputGPytorchGeometricKernel(gpytorch.kernels.Kernel):
 
     has_lengthscale = True
 
-    def __init__(self, geometric_kernel: BaseGeometricKernel, nu: float = 2.5, optimize_nu: bool = False, **kwargs) -> None: 
+    def __init__(self, geometric_kernel: BaseGeometricKernel, nu: float = 2.5, optimize_nu: bool = False, state=None, **kwargs) -> None: 
         super().__init__(**kwargs)
         self.geometric_kernel = geometric_kernel
-        _, self.state = self.geometric_kernel.init_params_and_state()
+        # The state holds the eigenpairs of the space. It is never modified, so it can be shared between kernels 
+        self.state = state if state is not None else self.geometric_kernel.init_params_and_state()[1]
 
         # Add nu either as a parameter or as a buffer depending on whether it should be optimized
         self.optimize_nu = optimize_nu
@@ -108,13 +109,15 @@ class GPytorchGeometricKernel(SingleOutputGPytorchGeometricKernel):
         if x1.ndim <= 2: 
             return self._forward_single_output_no_batch(x1, x2, params, diag, last_dim_is_batch, normalize=normalize, **kwargs)
         
-        # Otherwise, we have to iterate over the batch dimensions of x1 and x2. For now we only support a single batch dimension.
-        assert x1.ndim <= 3, "both x1 and x2 must have at most 3 dimensions"
+        # Otherwise, we have to iterate over the batch dimensions of x1 and x2, which we first flatten into a single one.
+        batch_shape = x1.shape[:-2]
+        x1, x2 = x1.flatten(end_dim=-3), x2.flatten(end_dim=-3)
         out = torch.stack([
             self._forward_single_output_no_batch(x1_, x2_, params, diag, last_dim_is_batch, normalize=False, **kwargs)
             for x1_, x2_ in zip(x1.unbind(0), x2.unbind(0))
         ], dim=0)
-        return out / self.normalizing_constant(params, x1[..., 0, :][None]) if normalize else out 
+        out = out / self.normalizing_constant(params, x1[..., 0, :][None]) if normalize else out 
+        return out.reshape(*batch_shape, *out.shape[1:])
 
     def forward(self, x1, x2, diag=False, last_dim_is_batch=False, normalize=True, **kwargs):
 
@@ -6,6 +6,8 @@ from mdgp.kernels.geometric_kernels_wrappers import GPytorchGeometricKernel
 
 class GeometricMaternKernel(GPytorchGeometricKernel):
 
-    def __init__(self, space: DiscreteSpectrumSpace, nu: float = 2.5, num_eigenfunctions: int = 10, batch_shape=torch.Size([]), optimize_nu=False, **kwargs):
-        geometric_kernel = MaternKarhunenLoeveKernel(space=space, num_eigenfunctions=num_eigenfunctions)
-        super().__init__(geometric_kernel=geometric_kernel, nu=nu, optimize_nu=optimize_nu, batch_shape=batch_shape, **kwargs)
+    def __init__(self, space: DiscreteSpectrumSpace, nu: float = 2.5, num_eigenfunctions: int = 10, batch_shape=torch.Size([]), optimize_nu=False, geometric_kernel=None, state=None, **kwargs):
+        # A geometric kernel (and its state) can be passed in to share the eigenpairs of the space between kernels 
+        if geometric_kernel is None: 
+            geometric_kernel = MaternKarhunenLoeveKernel(space=space, num_eigenfunctions=num_eigenfunctions)
+        super().__init__(geometric_kernel=geometric_kernel, nu=nu, optimize_nu=optimize_nu, state=state, batch_shape=batch_shape, **kwargs)
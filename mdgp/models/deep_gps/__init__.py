@@ -1,2 +1,3 @@
+from mdgp.models.deep_gps.variational_strategies import FusedVariationalStrategy
 from mdgp.models.deep_gps.layers import GeometricDeepGPLayer, EuclideanDeepGPLayer, ManifoldToManifoldDeepGPLayer
 from mdgp.models.deep_gps.deep_gps import *
\ No newline at end of file
@@ -2,10 +2,26 @@ import torch
 import gpytorch 
 from torch import Tensor
 from geometric_kernels.spaces import Space
+from geometric_kernels.kernels import MaternKarhunenLoeveKernel
 from mdgp.models.deep_gps import GeometricDeepGPLayer, EuclideanDeepGPLayer, ManifoldToManifoldDeepGPLayer
+from mdgp.samplers import get_feature_map
 from mdgp.utils import extrinsic_dimension
 
 
+def get_hidden_output_dims(space: Space, project_to_tangent: str, tangent_to_manifold: str) -> int: 
+    """
+    Returns the number of outputs of the hidden GPs of a manifold deep GP. Validates the projection arguments 
+    up front, so that invalid ones fail before any of the layers are constructed. 
+    """
+    if tangent_to_manifold not in {'exp', 'retr'}: 
+        raise NotImplementedError(f"Expected tangent_to_manifold either 'exp' or 'retr'. Got {tangent_to_manifold}.")
+    if project_to_tangent == 'intrinsic': 
+        return space.dim 
+    if project_to_tangent == 'extrinsic': 
+        return extrinsic_dimension(space)
+    raise NotImplementedError(f"Expected project_to_tangent either 'intrinsic' or 'extrinsic'. Got {project_to_tangent}.")
+
+
 class ManifoldDeepGP(gpytorch.models.deep_gps.DeepGP): 
 
     def __init__(self, hidden_gps, output_gp, space, project_to_tangent='instrinsic', tangent_to_manifold='exp', parametrised_frame=False):
@@ -53,16 +69,17 @@ class GeometricManifoldDeepGP(ManifoldDeepGP):
         sampler_inv_jitter=10e-8,
         outputscale_prior=None,
         parametrised_frame=False, 
+        share_covariance=False,
+        fused_variational_strategy=False,
         ) -> None:
 
-        # Dimension of the manifold is the last dimension of the inducing points
-        if project_to_tangent == 'intrinsic': 
-            hidden_output_dims = space.dim 
-        elif project_to_tangent == 'extrinsic': 
-            hidden_output_dims = extrinsic_dimension(space)
-        else: 
-            raise NotImplementedError(f"Expected project_to_tangent either 'intrinsic' or 'extrinsic'. Got {project_to_tangent}.")
+        hidden_output_dims = get_hidden_output_dims(space=space, project_to_tangent=project_to_tangent, tangent_to_manifold=tangent_to_manifold)
 
+        # All layers live on the same space, so they share a single geometric kernel (hence its eigenpairs) and feature map 
+        geometric_kernel = MaternKarhunenLoeveKernel(space=space, num_eigenfunctions=num_eigenfunctions)
+        _, geometric_kernel_state = geometric_kernel.init_params_and_state()
+        if isinstance(feature_map, str): 
+            feature_map = get_feature_map(feature_map=feature_map, geometric_kernel=geometric_kernel)
 
         hidden_gps = [
             GeometricDeepGPLayer(
@@ -77,6 +94,10 @@ class GeometricManifoldDeepGP(ManifoldDeepGP):
                 whitened_variational_strategy=whitened_variational_strategy,
                 sampler_inv_jitter=sampler_inv_jitter, 
                 outputscale_prior=outputscale_prior,
+                share_covariance=share_covariance,
+                geometric_kernel=geometric_kernel,
+                geometric_kernel_state=geometric_kernel_state,
+                fused_variational_strategy=fused_variational_strategy,
             )
             for _ in range(num_hidden)
         ]
@@ -92,6 +113,9 @@ class GeometricManifoldDeepGP(ManifoldDeepGP):
             optimize_nu=optimize_nu, 
             whitened_variational_strategy=whitened_variational_strategy,
             sampler_inv_jitter=sampler_inv_jitter,
+            geometric_kernel=geometric_kernel,
+            geometric_kernel_state=geometric_kernel_state,
+            fused_variational_strategy=fused_variational_strategy,
         )
 
         super().__init__(hidden_gps=hidden_gps, output_gp=output_gp, project_to_tangent=project_to_tangent, tangent_to_manifold=tangent_to_manifold, space=space, parametrised_frame=parametrised_frame)
@@ -111,13 +135,10 @@ class EuclideanManifoldDeepGP(ManifoldDeepGP):
         tangent_to_manifold='exp',
         outputscale_prior=None,
         parametrised_frame=False,
+        share_covariance=False,
+        fused_variational_strategy=False,
         ) -> None:
-        if project_to_tangent == 'intrinsic': 
-            hidden_output_dims = space.dim 
-        elif project_to_tangent == 'extrinsic': 
-            hidden_output_dims = extrinsic_dimension(space)
-        else: 
-            raise NotImplementedError(f"Expected project_to_tangent either 'intrinsic' or 'extrinsic'. Got {project_to_tangent}.")
+        hidden_output_dims = get_hidden_output_dims(space=space, project_to_tangent=project_to_tangent, tangent_to_manifold=tangent_to_manifold)
 
         hidden_gps = [
             EuclideanDeepGPLayer(
@@ -127,6 +148,8 @@ class EuclideanManifoldDeepGP(ManifoldDeepGP):
                 learn_inducing_locations=learn_inducing_locations,
                 mean_type='constant',
                 outputscale_prior=outputscale_prior,
+                share_covariance=share_covariance,
+                fused_variational_strategy=fused_variational_strategy,
             )
             for _ in range(num_hidden)
         ]
@@ -137,6 +160,7 @@ class EuclideanManifoldDeepGP(ManifoldDeepGP):
             nu=nu, 
             learn_inducing_locations=learn_inducing_locations,
             mean_type='constant',
+            fused_variational_strategy=fused_variational_strategy,
         )
         super().__init__(hidden_gps=hidden_gps, output_gp=output_gp, project_to_tangent=project_to_tangent, tangent_to_manifold=tangent_to_manifold, space=space, parametrised_frame=parametrised_frame)
 
@@ -151,6 +175,8 @@ class EuclideanDeepGP(gpytorch.models.deep_gps.DeepGP):
         nu: float = 2.5, 
         learn_inducing_locations: bool = False, 
         outputscale_prior=None,
+        share_covariance=False,
+        fused_variational_strategy=False,
         ) -> None:
         super().__init__()
         # Dimension of the manifold is the last dimension of the inducing points
@@ -164,6 +190,8 @@ class EuclideanDeepGP(gpytorch.models.deep_gps.DeepGP):
                 learn_inducing_locations=learn_inducing_locations,
                 mean_type='linear',
                 outputscale_prior=outputscale_prior,
+                share_covariance=share_covariance,
+                fused_variational_strategy=fused_variational_strategy,
             )
             for _ in range(num_hidden)
         ]
@@ -173,6 +201,7 @@ class EuclideanDeepGP(gpytorch.models.deep_gps.DeepGP):
             nu=nu, 
             learn_inducing_locations=learn_inducing_locations,
             mean_type='constant',
+            fused_variational_strategy=fused_variational_strategy,
         )
         self.likelihood = gpytorch.likelihoods.GaussianLikelihood()
         
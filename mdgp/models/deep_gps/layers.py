@@ -1,15 +1,31 @@
 import torch 
 import gpytorch 
 from torch import Tensor 
-from gpytorch.distributions import MultivariateNormal
+from gpytorch.distributions import MultivariateNormal, MultitaskMultivariateNormal
+from gpytorch.models import ApproximateGP
 from gpytorch.variational import UnwhitenedVariationalStrategy, VariationalStrategy
 from mdgp.kernels import GeometricMaternKernel
-from mdgp.samplers import RFFSampler, VISampler, PosteriorSampler, sample_naive
-from mdgp.models.projectors import ProjectToTangentExtrinsic, ProjectToTangentIntrinsic, ExponentialMap, Retraction
+from mdgp.models.deep_gps.variational_strategies import FusedVariationalStrategy
+from mdgp.samplers import RFFSampler, VISampler, PosteriorSampler
+from mdgp.models.projectors import ProjectToTangentExtrinsic, ProjectToTangentIntrinsic, ExponentialMap, Retraction, ProjectToTangentExtrinsicExponentialMap
+
+
+def initialize_outputscale(covar_module: gpytorch.kernels.ScaleKernel, outputscale) -> None: 
+    """
+    Writes the inverse-transformed outputscale straight into the raw parameter, bypassing the name resolution and 
+    setter dispatch of gpytorch's generic `initialize`. Unlike `initialize`, it does not check the value against 
+    the bounds of the raw parameter's constraint, so it is not simply a faster equivalent. The outputscale must be 
+    valid for the constraint. 
+    """
+    raw_outputscale = covar_module.raw_outputscale_constraint.inverse_transform(torch.as_tensor(outputscale))
+    covar_module.raw_outputscale.data.fill_(raw_outputscale.item())
 
 
 class DeepGPLayer(gpytorch.models.deep_gps.DeepGPLayer):
-    def __init__(self, mean_module, covar_module, inducing_points, output_dims, learn_inducing_locations=False, whitened_variational_strategy=True):
+    def __init__(self, mean_module, covar_module, inducing_points, output_dims, learn_inducing_locations=False, whitened_variational_strategy=True, share_covariance=False, fused_variational_strategy=False):
+        fused_variational_strategy = fused_variational_strategy and whitened_variational_strategy
+        if share_covariance and not fused_variational_strategy: 
+            raise NotImplementedError("Sharing the covariance across outputs is only supported with the fused (whitened) variational strategy.")
         batch_shape = torch.Size([output_dims]) if output_dims is not None else torch.Size([])
         num_inducing_points, input_dims = inducing_points.shape
 
@@ -18,7 +34,10 @@ class DeepGPLayer(gpytorch.models.deep_gps.DeepGPLayer):
             num_inducing_points=num_inducing_points,
             batch_shape=batch_shape
         )
-        variational_strategy_class = VariationalStrategy if whitened_variational_strategy else UnwhitenedVariationalStrategy
+        if whitened_variational_strategy: 
+            variational_strategy_class = FusedVariationalStrategy if fused_variational_strategy else VariationalStrategy
+        else: 
+            variational_strategy_class = UnwhitenedVariationalStrategy
         variational_strategy = variational_strategy_class(
             self,
             inducing_points,
@@ -29,22 +48,73 @@ class DeepGPLayer(gpytorch.models.deep_gps.DeepGPLayer):
         super().__init__(variational_strategy, input_dims, output_dims)
         self.mean_module = mean_module
         self.covar_module = covar_module
+        self.share_covariance = share_covariance and output_dims is not None
 
     def forward(self, x: Tensor) -> MultivariateNormal:
         mean_x = self.mean_module(x)
-        covar_x = self.covar_module(x)
+        if self.share_covariance: 
+            # Inputs are repeated along the output dimension (third to last), so with a kernel shared across outputs 
+            # the covariance is computed once and broadcast over the outputs by the variational strategy
+            covar_x = self.covar_module(x[..., 0, :, :]).unsqueeze(-3)
+        else: 
+            covar_x = self.covar_module(x)
         return MultivariateNormal(mean_x, covar_x)  
     
+    def _independent_outputs(self, inputs, are_samples=False, **kwargs):
+        """
+        Mirrors gpytorch's DeepGPLayer.__call__ up to, but excluding, assembling the block-diagonal 
+        MultitaskMultivariateNormal. Returns the batch of independent MultivariateNormals [..., O] + [N] and 
+        whether the inputs were deterministic. 
+        """
+        deterministic_inputs = not are_samples
+        if isinstance(inputs, MultitaskMultivariateNormal):
+            inputs = torch.distributions.Normal(loc=inputs.mean, scale=inputs.variance.sqrt()).rsample()
+            deterministic_inputs = False
+
+        # Repeat the input for all possible outputs
+        if self.output_dims is not None:
+            inputs = inputs.unsqueeze(-3)
+            inputs = inputs.expand(*inputs.shape[:-3], self.output_dims, *inputs.shape[-2:])
+
+        # Run inputs through the GP
+        return ApproximateGP.__call__(self, inputs, **kwargs), deterministic_inputs
+
+    def marginals(self, inputs, are_samples=False, **kwargs):
+        """
+        Computes the marginal means and standard deviations of the layer outputs, each of shape [..., N, O] 
+        (or [..., N] if output_dims is None), with a leading sample dimension of size num_likelihood_samples 
+        when the inputs are deterministic. Only the diagonal of the block-diagonal covariance is computed. 
+        """
+        output, deterministic_inputs = self._independent_outputs(inputs, are_samples=are_samples, **kwargs)
+        mean, stddev = output.mean, output.stddev
+        if self.output_dims is not None:
+            mean, stddev = mean.transpose(-1, -2), stddev.transpose(-1, -2)
+
+        # Maybe expand to the number of samples 
+        if deterministic_inputs:
+            sample_shape = torch.Size([gpytorch.settings.num_likelihood_samples.value()])
+            mean, stddev = mean.expand(*sample_shape, *mean.shape), stddev.expand(*sample_shape, *stddev.shape)
+        return mean, stddev
+
+    def predictive_mean(self, inputs, are_samples=False, **kwargs):
+        """
+        Computes the mean of the layer outputs, of shape [..., N, O] (or [..., N] if output_dims is None), without 
+        touching the covariance. For random inputs, the mean for the first sample is returned. 
+        """
+        output, deterministic_inputs = self._independent_outputs(inputs, are_samples=are_samples, **kwargs)
+        mean = output.mean.transpose(-1, -2) if self.output_dims is not None else output.mean
+        return mean if deterministic_inputs else mean[0]
+
     def sample_naive(self, inputs, are_samples=False, **kwargs):
-        return sample_naive(super().__call__(inputs, are_samples=are_samples, **kwargs))
+        mean, stddev = self.marginals(inputs, are_samples=are_samples, **kwargs)
+        return torch.distributions.Normal(loc=mean, scale=stddev).rsample()
 
     def sample_pathwise(self, inputs, are_samples=False):
         raise NotImplementedError
     
     def __call__(self, inputs, are_samples=False, sample=False, mean=False, **kwargs):
         if mean: 
-            with gpytorch.settings.num_likelihood_samples(1):
-                return super().__call__(inputs, are_samples=are_samples, **kwargs).mean[0]
+            return self.predictive_mean(inputs, are_samples=are_samples, **kwargs)
         if sample is None or sample is False: 
             return super().__call__(inputs, are_samples=are_samples, **kwargs)
         if sample == 'naive':
@@ -68,25 +138,36 @@ class GeometricDeepGPLayer(DeepGPLayer):
         whitened_variational_strategy=False, 
         sampler_inv_jitter=10e-8,
         outputscale_prior=None,
+        share_covariance: bool = False,
+        geometric_kernel=None,
+        geometric_kernel_state=None,
+        fused_variational_strategy: bool = False,
     ) -> None: 
         batch_shape = torch.Size([output_dims]) if output_dims is not None else torch.Size([])
+        kernel_batch_shape = torch.Size([]) if share_covariance else batch_shape
 
         # Initialize mean and kernel modules 
         mean_module = gpytorch.means.ConstantMean(
             batch_shape=batch_shape,
         )
         base_kernel = GeometricMaternKernel(
-            space=space, nu=nu, num_eigenfunctions=num_eigenfunctions, batch_shape=batch_shape, optimize_nu=optimize_nu
+            space=space, nu=nu, num_eigenfunctions=num_eigenfunctions, batch_shape=kernel_batch_shape, optimize_nu=optimize_nu, 
+            geometric_kernel=geometric_kernel, state=geometric_kernel_state,
         )
         covar_module = gpytorch.kernels.ScaleKernel(
             base_kernel=base_kernel,
-            batch_shape=batch_shape,
+            batch_shape=kernel_batch_shape,
             outputscale_prior=outputscale_prior,
         )
         if outputscale_prior is not None: 
-            covar_module.initialize(outputscale=outputscale_prior.mean)
+            initialize_outputscale(covar_module, outputscale=outputscale_prior.mean)
 
-        super().__init__(mean_module=mean_module, covar_module=covar_module, inducing_points=inducing_points, output_dims=output_dims, learn_inducing_locations=learn_inducing_locations, whitened_variational_strategy=whitened_variational_strategy)
+        super().__init__(mean_module=mean_module, covar_module=covar_module, inducing_points=inducing_points, output_dims=output_dims, learn_inducing_locations=learn_inducing_locations, whitened_variational_strategy=whitened_variational_strategy, share_covariance=share_covariance, fused_variational_strategy=fused_variational_strategy)
+
+        # The RFF sampler draws one prior function per kernel batch entry, so it needs a kernel per output
+        if self.share_covariance: 
+            self.sampler = None
+            return 
 
         # Set up posterior sampler. VISampler needs the VariationalDistribution object for that the changing parameters are tracked properly
         rff_sampler = RFFSampler(covar_module=covar_module, mean_module=mean_module, feature_map=feature_map)
@@ -94,6 +175,8 @@ class GeometricDeepGPLayer(DeepGPLayer):
         self.sampler = PosteriorSampler(rff_sampler=rff_sampler, vi_sampler=vi_sampler, inducing_points=inducing_points, whitened_variational_strategy=whitened_variational_strategy, inv_jitter=sampler_inv_jitter)
 
     def sample_pathwise(self, inputs, are_samples=False):
+        if self.sampler is None: 
+            raise NotImplementedError("Pathwise sampling is not supported when the covariance is shared across outputs.")
         # Clear cache if training, since otherwise we risk "trying to backward through the graph a second time" errors 
         if self.training: 
             self.variational_strategy._clear_cache()
@@ -108,7 +191,9 @@ class GeometricDeepGPLayer(DeepGPLayer):
         if are_samples: # [S, N, D]
             inputs_head_shape = inputs.shape[1:-1]
             inputs = inputs.flatten(start_dim=1, end_dim=-2)
-            sample = torch.stack([self.sampler(inputs_, sample_shape=torch.Size([])) for inputs_ in inputs.unbind(0)], dim=0)
+            # The inducing covariance is the same for every sample, so it is factorized once 
+            L_z_z = self.sampler.inducing_cholesky()
+            sample = torch.stack([self.sampler(inputs_, sample_shape=torch.Size([]), L_z_z=L_z_z) for inputs_ in inputs.unbind(0)], dim=0)
         else:
             inputs_head_shape = inputs.shape[:-1]
             inputs = inputs.flatten(start_dim=0, end_dim=-2)
@@ -133,8 +218,11 @@ class EuclideanDeepGPLayer(DeepGPLayer):
             constant_prior=None, 
             whitened_variational_strategy=True,
             outputscale_prior=None,
+            share_covariance=False,
+            fused_variational_strategy=False,
         ) -> None:
         batch_shape = torch.Size([output_dims]) if output_dims is not None else torch.Size([])
+        kernel_batch_shape = torch.Size([]) if share_covariance else batch_shape
         input_dims = inducing_points.size(-1)
 
         # Mean 
@@ -144,12 +232,12 @@ class EuclideanDeepGPLayer(DeepGPLayer):
             mean_module = gpytorch.means.LinearMean(input_dims)
 
         # Covariance 
-        base_kernel = gpytorch.kernels.MaternKernel(nu=nu, batch_shape=batch_shape, ard_num_dims=input_dims)
-        covar_module = gpytorch.kernels.ScaleKernel(base_kernel=base_kernel, batch_shape=batch_shape, ard_num_dims=None, outputscale_prior=outputscale_prior)
+        base_kernel = gpytorch.kernels.MaternKernel(nu=nu, batch_shape=kernel_batch_shape, ard_num_dims=input_dims)
+        covar_module = gpytorch.kernels.ScaleKernel(base_kernel=base_kernel, batch_shape=kernel_batch_shape, ard_num_dims=None, outputscale_prior=outputscale_prior)
         if outputscale_prior is not None: 
-            covar_module.initialize(outputscale=outputscale_prior.mean)
+            initialize_outputscale(covar_module, outputscale=outputscale_prior.mean)
 
-        super().__init__(mean_module=mean_module, covar_module=covar_module, inducing_points=inducing_points, output_dims=output_dims, learn_inducing_locations=learn_inducing_locations, whitened_variational_strategy=whitened_variational_strategy)
+        super().__init__(mean_module=mean_module, covar_module=covar_module, inducing_points=inducing_points, output_dims=output_dims, learn_inducing_locations=learn_inducing_locations, whitened_variational_strategy=whitened_variational_strategy, share_covariance=share_covariance, fused_variational_strategy=fused_variational_strategy)
 
 
 class ManifoldToManifoldDeepGPLayer(torch.nn.Module): 
@@ -169,10 +257,18 @@ class ManifoldToManifoldDeepGPLayer(torch.nn.Module):
         if tangent_to_manifold == 'retr': 
             self.tangent_to_manifold = Retraction(space=space)
 
+        # Extrinsic projection followed by the exponential map has a fused closed form 
+        self.project_to_tangent_and_manifold = None
+        if project_to_tangent == 'extrinsic' and tangent_to_manifold == 'exp':
+            self.project_to_tangent_and_manifold = ProjectToTangentExtrinsicExponentialMap(space=space)
+
     def forward(self, x, are_samples=False, return_hidden=False, mean=False, sample='naive'): 
         coeff = self.gp(x, mean=mean, sample=sample, are_samples=are_samples)
-        u = self.project_to_tangent(x=x, coeff=coeff)
-        y = self.tangent_to_manifold(x=x, u=u)
+        if self.project_to_tangent_and_manifold is not None: 
+            u, y = self.project_to_tangent_and_manifold(x=x, coeff=coeff)
+        else: 
+            u = self.project_to_tangent(x=x, coeff=coeff)
+            y = self.tangent_to_manifold(x=x, u=u)
         if return_hidden: 
             return {'coefficients': coeff, 'tangent': u, 'manifold': y}
         return y
@@ -4,6 +4,26 @@ from mdgp.frames import HypersphereFrame
 from mdgp.utils import space_to_manifold
 
 
+# Same thresholds as geoopt's Sphere.expmap, below which the exponential map falls back to a retraction
+_EXPMAP_EPS = {torch.float32: 1e-4, torch.float64: 1e-7}
+
+
+def hypersphere_project_to_tangent_and_expmap(x: torch.Tensor, coeff: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]: 
+    """
+    Fused extrinsic projection to the tangent space at x followed by the exponential map of the hypersphere. 
+    Equivalent to `ProjectToTangentExtrinsic` followed by `ExponentialMap`, but skips the (identity) subspace 
+    projections of `space_to_manifold` and computes everything in a single pass. 
+
+    :returns: The tangent vector and the resulting point on the hypersphere. 
+    """
+    u = coeff - (x * coeff).sum(dim=-1, keepdim=True) * x
+    norm_u = u.norm(dim=-1, keepdim=True)
+    exp = x * torch.cos(norm_u) + u * torch.sin(norm_u) / norm_u
+    retr = x + u
+    retr = retr / retr.norm(dim=-1, keepdim=True)
+    return u, torch.where(norm_u > _EXPMAP_EPS[norm_u.dtype], exp, retr)
+
+
 class ProjectToTangentIntrinsic(torch.nn.Module): 
     def __init__(self, space: Space, get_normal_vector=None) -> None: 
         assert isinstance(space, Hypersphere) and space.dim == 2, f"Only Hypersphere supported. Got space={space}"
@@ -24,6 +44,15 @@ class ProjectToTangentExtrinsic(torch.nn.Module):
         return self.manifold.proju(x=x, u=coeff)
     
 
+class ProjectToTangentExtrinsicExponentialMap(torch.nn.Module): 
+    def __init__(self, space: Space) -> None:
+        assert isinstance(space, Hypersphere), f"Only Hypersphere supported. Got space={space}"
+        super().__init__()
+
+    def forward(self, x: torch.Tensor, coeff: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]: 
+        return hypersphere_project_to_tangent_and_expmap(x=x, coeff=coeff)
+
+
 class ExponentialMap(torch.nn.Module): 
     def __init__(self, space: Space) -> None:
         super().__init__()
@@ -1,5 +1,5 @@
 from mdgp.samplers.geometric_kernels_sampler import Sampler as GeometricKernelsSampler
 from mdgp.samplers.vi_sampler import VISampler
-from mdgp.samplers.rff_sampler import RFFSampler
+from mdgp.samplers.rff_sampler import RFFSampler, get_feature_map
 from mdgp.samplers.posterior_sampler import PosteriorSampler
 from mdgp.samplers.naive_sampling import sample_naive
@@ -1,5 +1,4 @@
 import torch 
-import gpytorch 
 from typing import Tuple
 
 
@@ -26,21 +25,31 @@ class PosteriorSampler(torch.nn.Module):
     def sample_variational(self, sample_shape: torch.Size = torch.Size([])) -> torch.Tensor:
         return self.vi_sampler(sample_shape=sample_shape) # [S, O, M] or [S, M]
 
-    def compute_posterior_update(self, x, z, u, Phi_w_z, normalize=True): 
-        k_x_z = self.rff_sampler.covar_module(x, z, normalize=normalize) # [O, N, M] or [N, M]
-        K_z_z = self.rff_sampler.covar_module(z, z, normalize=normalize) # [O, M, M] or [M, M]
+    def inducing_cholesky(self, normalize=True) -> torch.Tensor: 
+        """
+        Cholesky factor of the jittered inducing covariance K_z_z. It only depends on the inducing points and the 
+        kernel parameters, so it can be computed once and shared by calls with different inputs.
+
+        :returns: [O, M, M] or [M, M]
+        """
+        K_z_z = self.rff_sampler.covar_module(self.inducing_points, self.inducing_points, normalize=normalize) # [O, M, M] or [M, M]
+        return K_z_z.add_jitter(self.inv_jitter).cholesky().evaluate()
+
+    def compute_posterior_update(self, x, z, u, Phi_w_z, normalize=True, L_z_z=None): 
+        k_x_z = self.rff_sampler.covar_module(x, z, normalize=normalize).evaluate() # [O, N, M] or [N, M]
+
+        # The factor of K_z_z is used both for whitening and for the solve, and is broadcast over the sample 
+        # dimension rather than refactorized for every sample
+        if L_z_z is None: 
+            L_z_z = self.inducing_cholesky(normalize=normalize) # [O, M, M] or [M, M]
         # FIXME temporary fix. Move this to VISampler
         if self.whitened_variational_strategy:
-            u = torch.einsum('...mn, ...n -> ...m', K_z_z.cholesky().evaluate(), u) + self.rff_sampler.mean_module(z)
-        delta = u - Phi_w_z # [S, O, M] or [S, M]
-
-        K_z_z = K_z_z.expand(*delta.shape[:-1], *K_z_z.shape[-2:]) # [S, O] + [M, M] or [S] + [M, M]
-        k_x_z = k_x_z.expand(*delta.shape[:-1], *k_x_z.shape[-2:]).evaluate() # [S, O] + [N, M] or [S] + [N, M]
-        delta = delta.unsqueeze(-1) # [S, O, M, 1] or [S, M, 1]
+            u = torch.einsum('...mn, ...n -> ...m', L_z_z, u) + self.rff_sampler.mean_module(z)
+        delta = (u - Phi_w_z).unsqueeze(-1) # [S, O, M, 1] or [S, M, 1]
 
-        return gpytorch.solve((K_z_z.add_jitter(self.inv_jitter)), delta, k_x_z).squeeze(-1)
+        return (k_x_z @ torch.cholesky_solve(delta, L_z_z)).squeeze(-1) # [S, O, N] or [S, N]
 
-    def forward(self, x, sample_shape: torch.Size = torch.Size([]), normalize_kernel=True) -> torch.Tensor:
+    def forward(self, x, sample_shape: torch.Size = torch.Size([]), normalize_kernel=True, L_z_z=None) -> torch.Tensor:
         z = self.inducing_points # [M, D]
 
         # Step 1. Get prior samples from RFF
@@ -50,5 +59,5 @@ class PosteriorSampler(torch.nn.Module):
         u = self.sample_variational(sample_shape=sample_shape) # [S, O, M] or [S, M]
 
         # Step 3. Update prior 
-        update = self.compute_posterior_update(x=x, z=z, u=u, Phi_w_z=Phi_w_z) # [S, O, N] or [S, N]
+        update = self.compute_posterior_update(x=x, z=z, u=u, Phi_w_z=Phi_w_z, L_z_z=L_z_z) # [S, O, N] or [S, N]
         return Phi_w_x + update 
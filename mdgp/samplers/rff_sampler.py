@@ -6,6 +6,25 @@ from geometric_kernels.kernels.feature_maps import deterministic_feature_map_com
 from geometric_kernels.spaces import DiscreteSpectrumSpace, NoncompactSymmetricSpace
 
 
+def get_feature_map(feature_map: str, geometric_kernel):
+    """
+    Builds a feature map of the given type for the geometric kernel. Feature maps are stateless, so layers sharing 
+    a geometric kernel can share the feature map too. 
+    """
+    space = geometric_kernel.space 
+    if feature_map == 'deterministic': 
+        if isinstance(space, DiscreteSpectrumSpace):
+            return deterministic_feature_map_compact(space=space, kernel=geometric_kernel)
+        raise NotImplementedError(f"Deterministic feature map only implemented for DiscreteSpectrumSpace. Got {type(space)}.")
+    if feature_map == 'random_phase':
+        if isinstance(space, DiscreteSpectrumSpace):
+            return random_phase_feature_map_compact(space=space, kernel=geometric_kernel)
+        if isinstance(space, NoncompactSymmetricSpace):
+            return random_phase_feature_map_noncompact(space=space)
+        raise NotImplementedError(f"Random phase feature map only implemented for DiscreteSpectrumSpace and NoncompactSymmetricSpace. Got {type(space)}.")
+    raise NotImplementedError(f"Expected feature_map either 'deterministic' or 'random_phase'. Got {feature_map}.")
+
+
 class RFFSampler(torch.nn.Module):
 
     def __init__(self, covar_module, mean_module, feature_map='deterministic') -> None: 
@@ -16,23 +35,12 @@ class RFFSampler(torch.nn.Module):
             self.covar_module = covar_module
             self.base_kernel = covar_module.base_kernel
             geometric_kernel = self.base_kernel.geometric_kernel
-            space = geometric_kernel.space 
         else:
             raise NotImplementedError(f"RFFSampler only implemented for ScaleKernel. Got {type(covar_module)}.")
 
         # Pick feature map to make sampler 
-        if feature_map == 'deterministic': 
-            if isinstance(space, DiscreteSpectrumSpace):
-                feature_map = deterministic_feature_map_compact(space=space, kernel=geometric_kernel)
-            else:
-                raise NotImplementedError(f"Deterministic feature map only implemented for DiscreteSpectrumSpace. Got {type(space)}.")
-        elif feature_map == 'random_phase':
-            if isinstance(space, DiscreteSpectrumSpace):
-                feature_map = random_phase_feature_map_compact(space=space, kernel=geometric_kernel)
-            elif isinstance(space, NoncompactSymmetricSpace):
-                feature_map = random_phase_feature_map_noncompact(space=space)
-            else:
-                raise NotImplementedError(f"Random phase feature map only implemented for DiscreteSpectrumSpace and NoncompactSymmetricSpace. Got {type(space)}.")
+        if isinstance(feature_map, str): 
+            feature_map = get_feature_map(feature_map=feature_map, geometric_kernel=geometric_kernel)
 
         # Set up sampler 
         self.geometric_kernels_sampler = GeometricKernelsSampler(feature_map=feature_map)
@@ -1,3 +1,4 @@
 from mdgp.utils.sphere import *
 from mdgp.utils.modules import *
-from mdgp.utils.geometric_kernels import * 
\ No newline at end of file
+from mdgp.utils.geometric_kernels import * 
+from mdgp.utils.dataclass_fields import *
\ No newline at end of file
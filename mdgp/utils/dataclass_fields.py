@@ -0,0 +1,28 @@
+from dataclasses import fields, MISSING
+
+
+__all__ = [
+    'specialize_non_default',
+]
+
+
+def specialize_non_default(cls):
+    """
+    Class decorator for dataclasses that generates a `_non_default` method returning a dictionary of 
+    all the fields whose values are different from their defaults. The comparisons are unrolled once at 
+    decoration time, so calling the method involves no reflection over `fields`. 
+
+    Fields without a default are always considered non-default. Must be applied on top of `@dataclass`.
+    """
+    namespace = {}
+    lines = ['def _non_default(self):', '    result = {}']
+    for i, field in enumerate(fields(cls)):
+        if field.default is MISSING:
+            lines.append(f'    result[{field.name!r}] = self.{field.name}')
+        else:
+            namespace[f'_default_{i}'] = field.default
+            lines.append(f'    if self.{field.name} != _default_{i}: result[{field.name!r}] = self.{field.name}')
+    lines.append('    return result')
+    exec('\n'.join(lines), namespace)
+    cls._non_default = namespace['_non_default']
+    return cls
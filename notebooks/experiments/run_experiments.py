@@ -1,17 +1,19 @@
 import geometric_kernels.torch
 import os 
 from argparse import ArgumentParser
-from torch import set_default_dtype, float64
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from torch import set_default_dtype, get_default_dtype, set_num_threads, float32, float64
 from torch.optim import Adam  
 from gpytorch.mlls import DeepApproximateMLL, VariationalELBO
 from mdgp.experiment_utils.data import get_data 
 from mdgp.experiment_utils.model import create_model
 from mdgp.experiment_utils.logging import CSVLogger, finalize 
 from mdgp.experiment_utils.training import fit, test_step
-from mdgp.experiment_utils import ExperimentConfigReader, set_experiment_seed, ExperimentStatus
+from mdgp.experiment_utils import ExperimentConfigReader, set_experiment_seed, ExperimentStatus, read_experiment_manifest
 
 
-def run_experiment(experiment_config, dir_path):
+def run_experiment(experiment_config, dir_path, compile_step=False):
     print(f"Running experiment with the config: {os.path.join(dir_path, experiment_config.file_name)}")
     # 0. Unpack arguments
     model_args, data_args, training_args = experiment_config.model_arguments, experiment_config.data_arguments, experiment_config.training_arguments
@@ -29,12 +31,12 @@ def run_experiment(experiment_config, dir_path):
     # 4. Train and validate model
     print("Training...")
     train_csv_logger = CSVLogger(root_dir=dir_path, name='train') 
-    val_csv_logger = CSVLogger(root_dir='logs/csv/val/', name='val') 
+    val_csv_logger = CSVLogger(root_dir=dir_path, name='val') 
     train_loggers = [train_csv_logger]
     val_loggers = [val_csv_logger]
     model = fit(model=model, optimizer=optimizer, criterion=elbo, train_loggers=train_loggers, 
                 val_loggers=val_loggers, train_inputs=train_inputs, train_targets=train_targets,
-                val_inputs=val_inputs, val_targets=val_targets, training_args=training_args)
+                val_inputs=val_inputs, val_targets=val_targets, training_args=training_args, compile_step=compile_step)
 
     # make sure logger files are saved
     finalize(loggers=[*val_loggers, *train_loggers])
@@ -51,32 +53,67 @@ def run_experiment(experiment_config, dir_path):
     print("Done!")
 
 
-def main(dir_path, overwrite=False, config_file_name='config.json'):
+def main(dir_path, overwrite=False, config_file_name='config.json', compile_step=False):
     with ExperimentConfigReader(os.path.join(dir_path, config_file_name), overwrite=overwrite) as experiment_config: 
         if experiment_config.status == ExperimentStatus.RUNNING: 
             set_experiment_seed(experiment_config.seed)
-            run_experiment(experiment_config=experiment_config, dir_path=dir_path)
+            run_experiment(experiment_config=experiment_config, dir_path=dir_path, compile_step=compile_step)
 
 
-def crawl_and_run(start_directory, config_file_name='config.json', overwrite=False):
-    # Iterate through the directory tree starting from the given directory
-    for dirpath, dirnames, filenames in os.walk(start_directory):
-        # Check if the file_name_to_match is in the current directory's file list
-        if config_file_name in filenames:
-            main(dir_path=dirpath, config_file_name=config_file_name, overwrite=overwrite)
+def find_experiment_dirs(start_directory, config_file_name='config.json'):
+    # Use the manifest written when the experiment tree was created if there is one, and crawl the tree otherwise
+    config_paths = read_experiment_manifest(start_directory)
+    if config_paths is not None: 
+        return [
+            os.path.join(start_directory, os.path.dirname(config_path)) for config_path in config_paths
+            if os.path.basename(config_path) == config_file_name and os.path.isfile(os.path.join(start_directory, config_path))
+        ]
+    return [dirpath for dirpath, dirnames, filenames in os.walk(start_directory) if config_file_name in filenames]
 
 
-if __name__ == "__main__":
-    set_default_dtype(float64)
+def init_worker(dtype, num_threads):
+    set_default_dtype(dtype)
+    set_num_threads(num_threads)
+
+
+def crawl_and_run(start_directory, config_file_name='config.json', overwrite=False, num_workers=1, compile_step=False):
+    dir_paths = find_experiment_dirs(start_directory=start_directory, config_file_name=config_file_name)
+    if num_workers <= 1: 
+        for dir_path in dir_paths: 
+            main(dir_path=dir_path, config_file_name=config_file_name, overwrite=overwrite, compile_step=compile_step)
+        return 
+    
+    # Spawn rather than fork workers, so that they do not inherit the parent's torch (or CUDA) state. The default 
+    # dtype is not inherited either, so it is set again in each worker, and the cores are split between workers
+    num_threads = max(1, os.cpu_count() // num_workers)
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=get_context('spawn'), 
+                             initializer=init_worker, initargs=(get_default_dtype(), num_threads)) as executor:
+        futures = [
+            executor.submit(main, dir_path=dir_path, config_file_name=config_file_name, overwrite=overwrite, compile_step=compile_step) 
+            for dir_path in dir_paths
+        ]
+        for future in as_completed(futures): 
+            future.result()
+
 
+DTYPES = {'fp32': float32, 'fp64': float64}
+
+
+if __name__ == "__main__":
     # Parse arguments 
     parser = ArgumentParser(description='Crawl through directories and run experiments based on config files.')
     parser.add_argument('dir_path', type=str, help='The parent directory to start crawling from.')
     parser.add_argument('--config_name', type=str, default='config.json', help='The name of the config file to match. Default is "config.json".')
     parser.add_argument('--overwrite', type=bool, default=False, help='Whether to overwrite existing experiments. Default is False.')
+    parser.add_argument('--dtype', type=str, default='fp64', choices=DTYPES.keys(), help='The default floating point precision. Default is "fp64".')
+    parser.add_argument('--num_workers', type=int, default=1, help='The number of experiments to run in parallel. Default is 1.')
+    parser.add_argument('--compile-fit', dest='compile_fit', default=False, action='store_true', help='Whether to compile the training step with torch.compile. Default is False.')
     args = parser.parse_args()
+
+    # Cholesky factorizations in gpytorch's variational strategies are computed in float64 regardless 
+    set_default_dtype(DTYPES[args.dtype])
     
-    crawl_and_run(start_directory=args.dir_path, config_file_name=args.config_name, overwrite=args.overwrite)
+    crawl_and_run(start_directory=args.dir_path, config_file_name=args.config_name, overwrite=args.overwrite, num_workers=args.num_workers, compile_step=args.compile_fit)
 
 
     """